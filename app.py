@@ -1,11 +1,177 @@
 import re
 import io
+import os
+import hashlib
+import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-from textblob import TextBlob
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
+import textblob
+from wordcloud import WordCloud, STOPWORDS
+
+# ---------------------------------------------------------------
+# CACHED HELPERS
+# ---------------------------------------------------------------
+# Streamlit reruns this whole script on every widget interaction, so the
+# expensive steps are cached. Helpers taking `_df` skip hashing the frame
+# (leading underscore) and are keyed on `key` instead, which identifies the
+# slice: (file hash, user, start date, end date, search word). These caches
+# are shared by all sessions for the server's lifetime, so each is capped.
+
+@st.cache_resource
+def chat_line_pattern():
+    return re.compile(r"^(\d{1,2}/\d{1,2}/\d{2,4}),\s*(\d{1,2}:\d{2}\s?[ap]m)\s*-\s*([^:]+):\s*(.*)$")
+
+
+@st.cache_resource
+def phrase_pattern():
+    return re.compile(r"((?i:\bnight study\b|\bnight stay\b)|<Media omitted>)")
+
+
+@st.cache_resource(max_entries=128)
+def word_pattern(word):
+    # The search box matches the typed text literally, ignoring case.
+    return re.compile(re.escape(word), re.IGNORECASE)
+
+
+def parse_dates(dates):
+    # Exports write d/m/yy or d/m/yyyy. Explicit formats parse in C; without one,
+    # pandas falls back to dateutil row by row, which dominated parse time.
+    # Trying both formats also keeps every row of a chat that mixes the two,
+    # where format inference from the first date would coerce the rest to NaT.
+    parsed = pd.to_datetime(dates, format="%d/%m/%y", errors="coerce")
+    parsed = parsed.fillna(pd.to_datetime(dates, format="%d/%m/%Y", errors="coerce"))
+    leftover = parsed.isna()
+    if leftover.any():
+        parsed[leftover] = pd.to_datetime(dates[leftover], errors="coerce", dayfirst=True)
+    return parsed
+
+
+@st.cache_data(show_spinner="Parsing chat…", max_entries=4)
+def parse_chat(_data: bytes, file_key) -> pd.DataFrame:
+    # Decode the whole upload once and split it in C, rather than holding a list
+    # of per-line bytes objects alongside their decoded copies. Split on "\n"
+    # only, like readlines(): splitlines() would also break messages on \u2028,
+    # \x0c etc. The final newline is dropped so no empty line trails the chat.
+    lines = _data.decode("utf-8", errors="ignore").removesuffix("\n").split("\n")
+    lines = list(map(str.strip, lines))
+
+    # Match the compiled pattern directly: pandas' str.extract runs Python's re
+    # per element as well, with more overhead per row than the match itself.
+    # Keep only the groups (None for continuation lines), not the Match objects;
+    # holding 100k+ of those alive makes the garbage collector rescan them.
+    groups = [m and m.groups() for m in map(chat_line_pattern().match, lines)]
+    is_header = np.fromiter(map(bool, groups), dtype=bool, count=len(groups))
+    df = pd.DataFrame(list(filter(None, groups)), columns=["date", "time", "sender", "message"])
+
+    # Lines that don't start with a timestamp continue the previous message.
+    # Number the messages by header (row i of df is message i + 1), collect
+    # just the continuation lines per message and join each list once.
+    gid = np.cumsum(is_header)
+    continuation = np.flatnonzero(~is_header & (gid > 0))
+    if len(continuation):
+        pieces = {}
+        for g, i in zip(gid[continuation].tolist(), continuation.tolist()):
+            pieces.setdefault(g, []).append(lines[i])
+        rows = np.fromiter(pieces, dtype=np.int64, count=len(pieces)) - 1
+        heads = df["message"].to_numpy()[rows]
+        df.loc[rows, "message"] = [" ".join([h, *p]) for h, p in zip(heads, pieces.values())]
+    df["date"] = parse_dates(df["date"])
+    df.dropna(subset=["date"], inplace=True)
+    df["sender"] = df["sender"].astype("category")
+    # Display-only; at most a day's worth of distinct minutes, so codes beat strings.
+    df["time"] = df["time"].astype("category")
+    return df
+
+
+@st.cache_resource
+def sentiment_lexicon():
+    """TextBlob's word -> polarity lexicon, averaged over senses the way its analyzer does."""
+    path = os.path.join(os.path.dirname(textblob.__file__), "en", "en-sentiment.xml")
+    entries = pd.DataFrame(
+        [(w.get("form").lower(), w.get("pos"), float(w.get("polarity", 0)))
+         for w in ET.parse(path).getroot().iter("word")],
+        columns=["form", "pos", "polarity"],
+    )
+    return entries.groupby(["form", "pos"])["polarity"].mean().groupby(level="form").mean()
+
+
+def filter_chat(df, start_ts, end_ts, user, word):
+    # One boolean mask, cheapest test first: the date range, then the sender
+    # codes, then the word regex over only the rows still selected.
+    mask = df["date"].between(start_ts, end_ts, inclusive="left").to_numpy(copy=True)
+    if user != "Overall":
+        mask &= (df["sender"] == user).to_numpy()
+    if word:
+        mask[mask] = df["message"][mask].str.contains(word_pattern(word), na=False).to_numpy()
+    return df.loc[mask]
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def daily_counts(_df, key):
+    return _df.groupby("date").size().reset_index(name="count")
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def sender_counts(_df, key):
+    # Senders outside this slice stay as empty categories; keep them off the charts.
+    counts = _df["sender"].cat.remove_unused_categories().value_counts().reset_index()
+    counts.columns = ["sender", "count"]
+    return counts
+
+
+@st.cache_data(show_spinner="Scoring sentiment…", max_entries=64)
+def sentiment_counts(_df, key):
+    # Mean lexicon polarity of each message's words, instead of a TextBlob per
+    # message (its tokenizer/tagger setup dominated this section on large chats).
+    # This only approximates TextBlob. A word directly after a separate "not" or
+    # "never" token scores -0.5x ("not good" -> -0.35, as in TextBlob). Not
+    # modelled: negation carried past short words ("not a good idea" stays
+    # Positive here, Negative in TextBlob), "n't" contractions (kept as one
+    # token, so "isn't" never negates), intensifiers ("very good") and "!".
+    # Some messages therefore land in a different bucket than TextBlob's.
+    words = _df["message"].str.lower().str.findall(r"[a-z']+").explode()
+    scores = words.map(sentiment_lexicon())
+    prev = words.groupby(level=0).shift().fillna("").astype(str)
+    negated = prev.isin(["not", "n't", "never"])
+    scores = scores.mask(negated, scores * -0.5)
+    polarity = scores.groupby(level=0).mean().fillna(0.0)
+    labels = np.select([polarity > 0, polarity < 0], ["Positive", "Negative"], "Neutral")
+    counts = pd.Series(labels).value_counts().reset_index()
+    counts.columns = ["Sentiment", "Count"]
+    return counts
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def phrase_hits(_df, file_key):
+    """Row labels of the messages mentioning each tracked phrase, found in one scan."""
+    hits = _df["message"].str.extractall(phrase_pattern())[0].str.lower()
+    rows = hits.index.get_level_values(0)
+    return {
+        phrase: rows[(hits == phrase).to_numpy()].unique()
+        for phrase in ("night study", "night stay", "<media omitted>")
+    }
+
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=600)
+def excel_report(_sheets, key):
+    output_excel = io.BytesIO()
+    with pd.ExcelWriter(output_excel, engine="xlsxwriter") as writer:
+        for sheet_name, sheet_df in _sheets.items():
+            sheet_df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output_excel.getvalue()
+
+
+@st.cache_data(show_spinner="Drawing word cloud…", max_entries=16)
+def wordcloud_image(_df, key):
+    # Count words with pandas and hand WordCloud the frequencies, rather than
+    # letting it tokenize one giant joined string in Python.
+    words = _df["message"].str.lower().str.findall(r"[a-z][a-z']{2,}").explode()
+    freq = words[~words.isin(STOPWORDS)].value_counts().head(200).to_dict()
+    if not freq:
+        return None
+    return WordCloud(width=800, height=400, background_color="white").generate_from_frequencies(freq).to_array()
 
 # ---------------------------------------------------------------
 # 1️⃣ CONFIGURATION
@@ -21,7 +187,8 @@ st.markdown("### 📊 Analyze group chats, messages, and trends — interactivel
 uploaded_file = st.sidebar.file_uploader("📁 Upload your WhatsApp chat (.txt)", type=["txt"])
 
 if uploaded_file is not None:
-    chat_data = uploaded_file.readlines()
+    file_bytes = uploaded_file.getvalue()
+    file_key = hashlib.md5(file_bytes).hexdigest()
 else:
     st.info("⬆️ Please upload your exported WhatsApp chat file to start.")
     st.stop()
@@ -29,33 +196,19 @@ else:
 # ---------------------------------------------------------------
 # 3️⃣ PARSE CHAT DATA
 # ---------------------------------------------------------------
-pattern = re.compile(r"^(\d{1,2}/\d{1,2}/\d{2,4}),\s*(\d{1,2}:\d{2}\s?[ap]m)\s*-\s*([^:]+):\s*(.*)$")
-
-messages = []
-for line in chat_data:
-    try:
-        line = line.decode("utf-8").strip()
-    except:
-        line = line.strip()
-    match = pattern.match(line)
-    if match:
-        date, time, sender, message = match.groups()
-        messages.append([date, time, sender, message])
-    elif messages:
-        messages[-1][3] += " " + line.strip()
-
-df = pd.DataFrame(messages, columns=["date", "time", "sender", "message"])
-df["date"] = pd.to_datetime(df["date"], errors="coerce", dayfirst=True)
-df.dropna(subset=["date"], inplace=True)
+df = parse_chat(file_bytes, file_key)
 
 # ---------------------------------------------------------------
 # 4️⃣ SIDEBAR FILTERS
 # ---------------------------------------------------------------
-users = sorted(df["sender"].unique())
+users = list(df["sender"].cat.categories)
 selected_user = st.sidebar.selectbox("👤 Select User (or 'Overall')", ["Overall"] + users)
 start_date, end_date = st.sidebar.date_input(
     "📅 Select Date Range", [df["date"].min(), df["date"].max()]
 )
+# Compare on the datetime64 column directly; the end date is inclusive.
+start_ts = pd.Timestamp(start_date)
+end_ts = pd.Timestamp(end_date) + pd.Timedelta(days=1)
 
 # Word filter input
 search_word = st.sidebar.text_input("🔍 Filter by Word/Phrase", "").strip()
@@ -64,28 +217,24 @@ analysis_choice = st.sidebar.selectbox(
     "🧩 Extra Analysis Feature", ["None", "Night Study / Stay", "Word Analysis"]
 )
 
+key = (file_key, selected_user, start_date, end_date, search_word)
+
 # ---------------------------------------------------------------
 # 5️⃣ OVERALL DASHBOARD
 # ---------------------------------------------------------------
 if analysis_choice == "None":
 
-    # Apply word filter if provided
+    filtered_df = filter_chat(df, start_ts, end_ts, selected_user, search_word)
+
     if search_word:
-        filtered_df = df[
-            (df["date"].dt.date >= start_date) & 
-            (df["date"].dt.date <= end_date) &
-            (df["message"].str.contains(search_word, case=False, na=False))
-        ]
         st.sidebar.info(f"📊 Showing messages containing: '{search_word}'")
-    else:
-        filtered_df = df[(df["date"].dt.date >= start_date) & (df["date"].dt.date <= end_date)]
 
     if selected_user == "Overall":
         st.subheader("🌍 Group Overview")
 
         total_messages = len(filtered_df)
         total_users = filtered_df["sender"].nunique()
-        total_media = filtered_df["message"].str.contains("<Media omitted>", na=False).sum()
+        total_media = filtered_df.index.isin(phrase_hits(df, file_key)["<media omitted>"]).sum()
 
         c1, c2, c3 = st.columns(3)
         c1.metric("Total Messages", total_messages)
@@ -93,7 +242,7 @@ if analysis_choice == "None":
         c3.metric("Media Shared", total_media)
 
         # Messages per day
-        daily = filtered_df.groupby("date").size().reset_index(name="count")
+        daily = daily_counts(filtered_df, key)
         if not daily.empty:
             fig1 = px.line(daily, x="date", y="count", title="Messages Per Day")
             st.plotly_chart(fig1, use_container_width=True)
@@ -102,10 +251,7 @@ if analysis_choice == "None":
 
         # Top senders
         if not filtered_df.empty:
-            top_senders = (
-                filtered_df["sender"].value_counts().reset_index().rename(columns={"index": "sender", "sender": "count"})
-            )
-            top_senders.columns = ["sender", "message_count"]
+            top_senders = sender_counts(filtered_df, key).rename(columns={"count": "message_count"})
             fig2 = px.bar(
                 top_senders.head(10),
                 x="sender",
@@ -117,14 +263,10 @@ if analysis_choice == "None":
             st.plotly_chart(fig2, use_container_width=True)
 
             # Word cloud
-            all_text = " ".join(filtered_df["message"].dropna())
-            if all_text.strip():
-                wc = WordCloud(width=800, height=400, background_color="white").generate(all_text)
+            wc = wordcloud_image(filtered_df, key)
+            if wc is not None:
                 st.subheader("☁️ Most Common Words")
-                fig, ax = plt.subplots()
-                ax.imshow(wc, interpolation="bilinear")
-                ax.axis("off")
-                st.pyplot(fig)
+                st.image(wc, width="stretch")
         else:
             st.info("No data available for the selected filters.")
 
@@ -134,7 +276,7 @@ if analysis_choice == "None":
     else:
         st.subheader(f"👤 User Analysis: {selected_user}")
 
-        user_df = filtered_df[filtered_df["sender"] == selected_user]
+        user_df = filtered_df  # already narrowed to selected_user
         msg_count = len(user_df)
         first_date = user_df["date"].min().strftime("%d %b %Y") if not user_df.empty else "-"
         last_date = user_df["date"].max().strftime("%d %b %Y") if not user_df.empty else "-"
@@ -146,30 +288,19 @@ if analysis_choice == "None":
 
         if not user_df.empty:
             # Message trend
-            trend = user_df.groupby("date").size().reset_index(name="count")
+            trend = daily_counts(user_df, key)
             fig = px.area(trend, x="date", y="count", title="Messages Over Time")
             st.plotly_chart(fig, use_container_width=True)
 
             # Word cloud
-            all_text = " ".join(user_df["message"].dropna())
-            if all_text.strip():
-                wc = WordCloud(width=800, height=400, background_color="white").generate(all_text)
+            wc = wordcloud_image(user_df, key)
+            if wc is not None:
                 st.subheader("🗣️ Frequent Words Used")
-                fig, ax = plt.subplots()
-                ax.imshow(wc, interpolation="bilinear")
-                ax.axis("off")
-                st.pyplot(fig)
+                st.image(wc, width="stretch")
 
             # Sentiment
-            user_df["sentiment"] = user_df["message"].apply(lambda x: TextBlob(x).sentiment.polarity)
-            sentiment_counts = (
-                user_df["sentiment"]
-                .apply(lambda x: "Positive" if x > 0 else "Negative" if x < 0 else "Neutral")
-                .value_counts()
-                .reset_index()
-            )
-            sentiment_counts.columns = ["Sentiment", "Count"]
-            fig_sent = px.pie(sentiment_counts, values="Count", names="Sentiment", title="Sentiment Distribution")
+            sentiment = sentiment_counts(user_df, key)
+            fig_sent = px.pie(sentiment, values="Count", names="Sentiment", title="Sentiment Distribution")
             st.plotly_chart(fig_sent, use_container_width=True)
 
             st.subheader("📜 Message Log")
@@ -188,8 +319,9 @@ elif analysis_choice == "Night Study / Stay":
     )
 
     # Filter messages containing those phrases
-    night_study_df = df[df["message"].str.contains(r"\bnight study\b", case=False, na=False)]
-    night_stay_df = df[df["message"].str.contains(r"\bnight stay\b", case=False, na=False)]
+    hits = phrase_hits(df, file_key)
+    night_study_df = df.loc[hits["night study"]]
+    night_stay_df = df.loc[hits["night stay"]]
 
     study_users = night_study_df["sender"].nunique()
     stay_users = night_stay_df["sender"].nunique()
@@ -218,12 +350,15 @@ elif analysis_choice == "Night Study / Stay":
     else:
         st.info("No messages found containing 'night stay'.")
 
-    # Downloadable Excel report
-    output_excel = io.BytesIO()
-    with pd.ExcelWriter(output_excel, engine="openpyxl") as writer:
-        night_study_df.to_excel(writer, index=False, sheet_name=f"Night Study ({study_users})")
-        night_stay_df.to_excel(writer, index=False, sheet_name=f"Night Stay ({stay_users})")
-    output_excel.seek(0)
+    # Downloadable Excel report (built once per file). This section ignores the
+    # sidebar filters, so the file alone identifies the report.
+    output_excel = excel_report(
+        {
+            f"Night Study ({study_users})": night_study_df,
+            f"Night Stay ({stay_users})": night_stay_df,
+        },
+        (file_key, "night"),
+    )
 
     st.download_button(
         "⬇️ Download Night Study/Stay Excel Report",
@@ -243,17 +378,7 @@ elif analysis_choice == "Word Analysis":
     )
     
     if search_word:
-        # Filter messages containing the word
-        word_filtered_df = df[df["message"].str.contains(search_word, case=False, na=False)]
-        
-        # Apply date filter
-        word_filtered_df = word_filtered_df[
-            (word_filtered_df["date"].dt.date >= start_date) & 
-            (word_filtered_df["date"].dt.date <= end_date)
-        ]
-        
-        if selected_user != "Overall":
-            word_filtered_df = word_filtered_df[word_filtered_df["sender"] == selected_user]
+        word_filtered_df = filter_chat(df, start_ts, end_ts, selected_user, search_word)
         
         if not word_filtered_df.empty:
             # Key Metrics
@@ -273,15 +398,14 @@ elif analysis_choice == "Word Analysis":
             
             with col1:
                 # Timeline of mentions
-                timeline = word_filtered_df.groupby("date").size().reset_index(name="count")
+                timeline = daily_counts(word_filtered_df, key)
                 fig_timeline = px.line(timeline, x="date", y="count", 
                                      title=f"Timeline of '{search_word}' Mentions")
                 st.plotly_chart(fig_timeline, use_container_width=True)
             
             with col2:
                 # Top users mentioning the word
-                top_mentions = word_filtered_df["sender"].value_counts().reset_index()
-                top_mentions.columns = ["sender", "count"]
+                top_mentions = sender_counts(word_filtered_df, key)
                 fig_mentions = px.bar(top_mentions, x="sender", y="count", 
                                     title=f"Who mentioned '{search_word}' the most")
                 st.plotly_chart(fig_mentions, use_container_width=True)
@@ -300,21 +424,20 @@ elif analysis_choice == "Word Analysis":
             display_df = word_filtered_df[["date", "time", "sender", "message"]].reset_index(drop=True)
             st.dataframe(display_df, height=400, use_container_width=True)
             
-            # Downloadable Excel report
-            output_excel = io.BytesIO()
-            with pd.ExcelWriter(output_excel, engine="openpyxl") as writer:
-                word_filtered_df.to_excel(writer, index=False, sheet_name=f"Word Analysis ({unique_users})")
-                
-                # Add summary sheet
-                summary_data = {
-                    'Metric': ['Search Word', 'Total Mentions', 'Unique Users', 'Date Range', 
-                             'First Mention', 'Last Mention'],
-                    'Value': [search_word, total_mentions, unique_users, 
-                             f"{start_date} to {end_date}", first_mention, last_mention]
-                }
-                pd.DataFrame(summary_data).to_excel(writer, index=False, sheet_name="Summary")
-                
-            output_excel.seek(0)
+            # Downloadable Excel report (rebuilt only when the filters change)
+            summary_data = {
+                'Metric': ['Search Word', 'Total Mentions', 'Unique Users', 'Date Range', 
+                         'First Mention', 'Last Mention'],
+                'Value': [search_word, total_mentions, unique_users, 
+                         f"{start_date} to {end_date}", first_mention, last_mention]
+            }
+            output_excel = excel_report(
+                {
+                    f"Word Analysis ({unique_users})": word_filtered_df,
+                    "Summary": pd.DataFrame(summary_data),
+                },
+                key,
+            )
 
             st.download_button(
                 f"⬇️ Download '{search_word}' Analysis Excel Report",